@@ -1,42 +1,125 @@
-from flask import Flask, request, jsonify, send_from_directory
-from scripts.spotify_youtube_converter import process_playlist, start_download
+from quart import Blueprint, Quart, Response, abort, current_app, request, jsonify
+from scripts.spotify_youtube_converter import (
+    process_playlist, run_download_job, get_job_status, set_job_status, stream_playlist_zip,
+    remove_playlist_files, to_json
+)
+from uuid import uuid4
+import asyncio
 import os
 
-# Initialize Flask app
-app = Flask(__name__, static_folder='public')
+bp = Blueprint('main', __name__)
 
-# Ensure downloads directory exists
-if not os.path.exists('downloads'):
-    os.makedirs('downloads')
-if not os.path.exists('downloads/temp'):
-    os.makedirs('downloads/temp')
+# How long /status waits for a job it can't find before reporting it unknown
+UNKNOWN_JOB_GRACE = 10  # seconds
 
-@app.route('/')
-def home():
-    return app.send_static_file('index.html')
+@bp.route('/')
+async def home():
+    return await current_app.send_static_file('index.html')
 
-@app.route('/convert', methods=['POST'])
-def convert():
-    data = request.json
+@bp.route('/convert', methods=['POST'])
+async def convert():
+    data = await request.get_json()
     if 'url' in data:
-        # Initial playlist processing
-        result = process_playlist(data['url'])
-        return jsonify(result)
+        # Initial playlist processing is blocking, so run it off the event loop
+        result = await asyncio.to_thread(process_playlist, data['url'])
+        # The song list can be thousands of entries, so skip jsonify's stdlib encoder
+        return Response(to_json(result), mimetype='application/json')
     elif 'songs' in data:
-        # Start download after confirmation
-        result = start_download(data['songs'])
-        return jsonify(result)
+        # Start download after confirmation; progress is reported on /status/<task_id>
+        task_id = uuid4().hex
+        # Record the job before answering, so /status on any worker can find it right away
+        await asyncio.to_thread(set_job_status, task_id, {
+            'state': 'queued', 'completed': 0, 'total': len(data['songs'])
+        })
+        current_app.add_background_task(run_download_job, task_id, data['songs'])
+        return jsonify({'success': True, 'phase': 'queued', 'task_id': task_id}), 202
     else:
         return jsonify({'success': False, 'error': 'Invalid request'})
 
-@app.route('/downloads/<path:filename>')
-def download_file(filename):
-    return send_from_directory('downloads', filename)
+async def status_events(task_id):
+    """Send the job status as server-sent events until the download finishes"""
+    last_status = None
+    missing_polls = 0
+    while True:
+        status = await asyncio.to_thread(get_job_status, task_id)
+        if status is None:
+            # Treat a missing job as pending for a while before giving up on it
+            missing_polls += 1
+            if missing_polls < UNKNOWN_JOB_GRACE:
+                status = {'state': 'queued', 'completed': 0, 'total': 0}
+            else:
+                status = {'state': 'finished', 'result': {'success': False, 'error': 'Unknown download task'}}
+        if status != last_status:
+            yield b"data: " + to_json(status) + b"\n\n"
+            last_status = status
+        else:
+            # A comment line keeps idle proxies from closing the stream during long songs
+            yield b": keepalive\n\n"
+        if status['state'] == 'finished':
+            return
+        await asyncio.sleep(1)
 
-@app.route('/health')
-def health_check():
+@bp.route('/status/<task_id>')
+async def download_status(task_id):
+    return Response(status_events(task_id), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache'
+    })
+
+# zipstream-ng yields 64 KiB pieces; batching them cuts thread handoffs and socket writes 16x
+ZIP_BLOCK_SIZE = 1024 * 1024
+
+def read_zip_block(chunks):
+    """Join ZIP chunks into one block of about ZIP_BLOCK_SIZE bytes, or b'' once exhausted"""
+    block = []
+    size = 0
+    for chunk in chunks:
+        block.append(chunk)
+        size += len(chunk)
+        if size >= ZIP_BLOCK_SIZE:
+            break
+    return b''.join(block)
+
+async def iterate_zip(zip_filename, zs):
+    """Generate ZIP blocks in a worker thread and clean up once fully sent"""
+    chunks = iter(zs)
+    while block := await asyncio.to_thread(read_zip_block, chunks):
+        yield block
+    # Only reached when the client received the whole archive
+    await asyncio.to_thread(remove_playlist_files, zip_filename)
+
+@bp.route('/downloads/<path:filename>')
+async def download_file(filename):
+    # Playlist archives are generated on the fly from the downloaded songs
+    zs = stream_playlist_zip(filename)
+    if zs is not None:
+        return Response(iterate_zip(filename, zs), mimetype='application/zip', headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'Content-Length': str(len(zs))
+        })
+    # Nothing else under downloads/ is meant to be public, e.g. in-progress job files
+    abort(404)
+
+@bp.route('/health')
+async def health_check():
     return jsonify({'status': 'healthy'})
 
+def create_app():
+    """Create the Quart app"""
+    app = Quart(__name__, static_folder='public')
+    # Status streams and ZIP downloads run for as long as the playlist needs
+    app.config['RESPONSE_TIMEOUT'] = None
+
+    # Ensure downloads directory exists
+    if not os.path.exists('downloads'):
+        os.makedirs('downloads')
+    if not os.path.exists('downloads/temp'):
+        os.makedirs('downloads/temp')
+
+    app.register_blueprint(bp)
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=False)
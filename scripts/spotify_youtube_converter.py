@@ -1,17 +1,27 @@
 import os
-import json
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import spotipy
 from spotipy.oauth2 import SpotifyClientCredentials
-from googleapiclient.discovery import build
-from urllib.parse import urlparse
 import yt_dlp
 import zipfile
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime
+from zipstream import ZipStream
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import time
 import sys
+import glob
+import re
 import subprocess
-import traceback
+import logging
 import shutil
+import threading
+import random
+import weakref
+from functools import lru_cache
+from uuid import uuid4
+import diskcache
 
 
 # Dotenv handling for Railway deployment (if applicable)
@@ -21,6 +31,20 @@ try:
 except ImportError:
     pass
 
+# orjson serializes large song lists several times faster; stdlib json is the fallback
+try:
+    import orjson
+
+    def to_json(obj):
+        """Serialize obj to UTF-8 JSON bytes"""
+        return orjson.dumps(obj)
+except ImportError:
+    import json
+
+    def to_json(obj):
+        """Serialize obj to UTF-8 JSON bytes"""
+        return json.dumps(obj, separators=(',', ':')).encode()
+
 
 # Directory setup
 DOWNLOADS_DIR = 'downloads'
@@ -28,10 +52,73 @@ TEMP_DIR = os.path.join(DOWNLOADS_DIR, 'temp')
 os.makedirs(DOWNLOADS_DIR, exist_ok=True)
 os.makedirs(TEMP_DIR, exist_ok=True)
 
+# Persistent cache for Spotify playlists, YouTube search results and job status. It sits
+# beside DOWNLOADS_DIR rather than inside it so no download route can ever serve it
+CACHE_DIR = 'cache'
+PLAYLIST_CACHE_TTL = 7 * 86400  # Playlists are revalidated via snapshot_id on every request
+SEARCH_CACHE_TTL = 30 * 86400  # A track's best YouTube match rarely changes
+JOB_TTL = 86400
+cache = diskcache.Cache(CACHE_DIR)
+# Converted songs are kept in their own size-capped cache so repeat tracks skip yt-dlp and
+# ffmpeg entirely; eviction here never pushes out the small playlist and search entries
+AUDIO_CACHE_SIZE = 2 * 1024 ** 3
+audio_cache = diskcache.Cache(os.path.join(CACHE_DIR, 'audio'), size_limit=AUDIO_CACHE_SIZE)
+
+# Maximum number of songs downloading at the same time. Downloads wait on the network,
+# not the CPU, so this scales well past the core count
+DOWNLOAD_CONCURRENCY = int(os.getenv('MAX_DL_WORKERS', min(32, (os.cpu_count() or 4) * 4)))
+# Maximum number of ffmpeg conversions at the same time; encoding is CPU-bound
+TRANSCODE_CONCURRENCY = os.cpu_count() or 1
+
+# Downloads, transcodes and cache I/O each get their own process-wide pool. asyncio's default
+# executor stops at cpu_count + 4 threads, which would quietly cap DOWNLOAD_CONCURRENCY, and
+# the server's status polls and ZIP streaming would queue behind ffmpeg in it
+_download_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_CONCURRENCY, thread_name_prefix='download')
+_transcode_executor = ThreadPoolExecutor(max_workers=TRANSCODE_CONCURRENCY, thread_name_prefix='transcode')
+# Audio cache copies and job status writes, which can wait on the SQLite lock
+_cache_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='cache')
+# Deletes finished playlist directories without holding up the response
+_cleanup_executor = ThreadPoolExecutor(max_workers=1)
+
+# ytsearch queries are spaced out across all download threads; past this rate YouTube
+# starts answering 429, and every worker then stalls on its own retries
+SEARCH_RATE_LIMIT = 10  # queries per second
+SEARCH_RETRIES = 5
+_RATE_LIMITED = re.compile(r'HTTP Error (?:429|503)')
+_search_lock = threading.Lock()
+_next_search_at = 0.0
+
+# Spotify returns at most 100 playlist items per request
+PLAYLIST_PAGE_SIZE = 100
+
+# 'mp3' transcodes every song to 192 kbps MP3, 'remux' writes M4A so AAC sources
+# are stream-copied by ffmpeg instead of going through a full re-encode
+AUDIO_MODE = os.getenv('AUDIO_MODE', 'mp3')
+AUDIO_CODEC = 'm4a' if AUDIO_MODE == 'remux' else 'mp3'
+# Remuxing only avoids the encode when the source is AAC, so prefer YouTube's m4a streams
+AUDIO_FORMAT = 'bestaudio[ext=m4a]/bestaudio/best' if AUDIO_MODE == 'remux' else 'bestaudio/best'
+
+# Matches playlist IDs in open.spotify.com URLs, spotify:playlist: URIs and bare IDs
+_PLAYLIST_ID = re.compile(r'(?:playlist[/:]|^)([A-Za-z0-9]{22})(?![A-Za-z0-9])')
+
+# Filenames keep letters, digits, spaces and dashes; \w also covers "_", so drop it separately
+_UNSAFE_FILENAME_CHARS = re.compile(r'[^\w\- ]+|_+')
+
+# MP3s are already compressed, so deflating them only burns CPU for ~0% gain
+ZIP_COMPRESSION = zipfile.ZIP_STORED
+
+
+# Tracebacks are only formatted when DEBUG is set; errors still log a one-line summary
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG if os.getenv('DEBUG') else logging.INFO)
+_log_handler = logging.StreamHandler(sys.stderr)
+_log_handler.setFormatter(logging.Formatter('%(message)s'))
+logger.addHandler(_log_handler)
+logger.propagate = False
 
 def log(message):
     """Log message to stderr for server to capture"""
-    print(message, file=sys.stderr, flush=True)
+    logger.info(message)
 
 
 class CustomLogger:
@@ -46,20 +133,102 @@ class CustomLogger:
         log(f"Error: {msg}")
 
 
-def get_spotify_playlist_tracks(playlist_id):
-    """Fetch tracks from Spotify playlist"""
-    log("Fetching Spotify playlist tracks...")
+# yt-dlp options shared by every download; download_song sets the output template per song.
+# There are no postprocessors: convert_song runs ffmpeg separately so encoding is scheduled
+# apart from the network-bound downloads.
+_YDL_LOGGER = CustomLogger()
+_BASE_YDL_OPTS = {
+    'format': AUDIO_FORMAT,
+    'quiet': True,
+    'no_warnings': False,
+    'logger': _YDL_LOGGER,
+    'writethumbnail': False,
+    'concurrent_fragment_downloads': 4,
+    'http_chunk_size': 10 * 1024 * 1024,
+    'noplaylist': True,
+    'retries': 3,
+    'fragment_retries': 3,
+    'socket_timeout': 15,
+}
+
+# One YoutubeDL per download thread, so extractors are set up once
+_thread_local = threading.local()
+
+
+def _get_youtube_dl():
+    """Return this thread's YoutubeDL, creating it on first use"""
+    ydl = getattr(_thread_local, 'ydl', None)
+    if ydl is None:
+        # Pass the directory containing ffmpeg
+        _, ffmpeg_dir = _resolve_ffmpeg()
+        ydl = yt_dlp.YoutubeDL({**_BASE_YDL_OPTS, 'ffmpeg_location': ffmpeg_dir})
+        weakref.finalize(threading.current_thread(), ydl.close)
+        _thread_local.ydl = ydl
+    return ydl
+
+
+@lru_cache(maxsize=1)
+def _get_spotify_client():
+    """Create the Spotify client once so its access token is reused across requests"""
+    # A pooled session keeps TLS connections open between token, playlist and page requests;
+    # Retry honours Spotify's Retry-After header on 429 responses
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=8,
+        pool_maxsize=32,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=frozenset(['GET', 'POST'])
+        )
+    )
+    session.mount('https://', adapter)
+    
     client_credentials_manager = SpotifyClientCredentials(
         client_id=os.getenv('SPOTIPY_CLIENT_ID'),
-        client_secret=os.getenv('SPOTIPY_CLIENT_SECRET')
+        client_secret=os.getenv('SPOTIPY_CLIENT_SECRET'),
+        requests_session=session
+    )
+    return spotipy.Spotify(
+        client_credentials_manager=client_credentials_manager,
+        requests_session=session
     )
-    sp = spotipy.Spotify(client_credentials_manager=client_credentials_manager)
+
+
+def get_spotify_playlist_tracks(playlist_id):
+    """Fetch tracks from Spotify playlist"""
+    log("Fetching Spotify playlist tracks...")
+    sp = _get_spotify_client()
+    
+    # Only request the fields we use; the full object embeds the first 100 tracks
+    playlist_info = sp.playlist(playlist_id, fields='name,owner(display_name),snapshot_id,tracks(total)')
+    
+    # snapshot_id changes whenever the playlist does, so a match means the cache is current
+    cache_key = f"playlist:{playlist_id}"
+    snapshot_id = playlist_info['snapshot_id']
+    cached = cache.get(cache_key)
+    if cached and cached['snapshot_id'] == snapshot_id:
+        log(f"Using cached tracks for Spotify playlist: {cached['playlist_info']['name']}")
+        return cached['songs'], cached['playlist_info']
     
-    playlist_info = sp.playlist(playlist_id)
     playlist_name = playlist_info['name']
     playlist_owner = playlist_info['owner']['display_name']
-    results = sp.playlist_tracks(playlist_id)
-    tracks = results['items']
+    total = playlist_info['tracks']['total']
+    
+    def fetch_page(offset):
+        return sp.playlist_items(
+            playlist_id,
+            offset=offset,
+            limit=PLAYLIST_PAGE_SIZE,
+            fields='items(track(name,artists(name),duration_ms))',
+            additional_types=('track',)
+        )
+    
+    # Fetch every page at once instead of stopping after the first 100 tracks
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        pages = executor.map(fetch_page, range(0, total, PLAYLIST_PAGE_SIZE))
+        tracks = [track for page in pages for track in page['items']]
     songs = []
     
     for track in tracks:
@@ -79,235 +248,363 @@ def get_spotify_playlist_tracks(playlist_id):
         "owner": playlist_owner,
         "track_count": len(songs)
     }
+    cache.set(cache_key, {
+        "snapshot_id": snapshot_id,
+        "songs": songs,
+        "playlist_info": playlist_info
+    }, expire=PLAYLIST_CACHE_TTL)
     log(f"Found {len(songs)} tracks in the Spotify playlist: {playlist_name}")
     return songs, playlist_info
 
 
-def get_youtube_links(songs):
-    """Get YouTube URLs for songs"""
-    log("Fetching YouTube links...")
-    youtube = build('youtube', 'v3', developerKey=os.getenv('YOUTUBE_API_KEY'))
-    youtube_links = []
+@lru_cache(maxsize=1)
+def _resolve_ffmpeg():
+    """Locate a working FFmpeg once and return (ffmpeg_path, ffmpeg_dir)"""
+    # Try to find FFmpeg in common locations, letting deployments pin it via FFMPEG_PATH
+    ffmpeg_locations = [
+        os.getenv('FFMPEG_PATH'),
+        shutil.which("ffmpeg"),  # Look in PATH
+        "/usr/bin/ffmpeg",
+        "/usr/local/bin/ffmpeg",
+        "/nix/store/*/ffmpeg/bin/ffmpeg"  # Nixpacks often installs here
+    ]
     
-    for song in songs:
-        try:
-            query = f"{song['artist']} - {song['title']}"
-            request = youtube.search().list(
-                part="id,snippet",
-                q=query,
-                type="video",
-                maxResults=1
-            )
-            response = request.execute()
-            if response['items']:
-                video_id = response['items'][0]['id']['videoId']
-                youtube_links.append(f"https://www.youtube.com/watch?v={video_id}")
-            else:
-                youtube_links.append("No result found")
-                log(f"No YouTube result found for: {query}")
-        except Exception as e:
-            log(f"Error searching for {query}: {str(e)}")
-            youtube_links.append("Error: Could not search")
+    # Use the first working FFmpeg we find
+    ffmpeg_path = None
+    for loc in ffmpeg_locations:
+        if not loc:
+            continue
+        if '*' in loc:
+            # Handle glob patterns
+            matches = glob.glob(loc)
+            for match in matches:
+                try:
+                    result = subprocess.run([match, "-version"], capture_output=True, check=True, timeout=5)
+                    log(f"Found working FFmpeg at: {match}")
+                    ffmpeg_path = match
+                    break
+                except Exception:
+                    continue
+            if ffmpeg_path:
+                break
+        else:
+            try:
+                result = subprocess.run([loc, "-version"], capture_output=True, check=True, timeout=5)
+                log(f"Found working FFmpeg at: {loc}")
+                ffmpeg_path = loc
+                break
+            except Exception:
+                continue
     
-    return youtube_links
+    if not ffmpeg_path:
+        log("ERROR: Could not find a working FFmpeg installation!")
+        return None, None
+
+    log(f"Using FFmpeg from: {ffmpeg_path}")
+
+    # Now extract the directory
+    ffmpeg_dir = os.path.dirname(ffmpeg_path)
+
+    # Check if directory is not empty
+    if not ffmpeg_dir:
+        log("WARNING: FFmpeg directory is empty, using hardcoded path")
+        ffmpeg_dir = "/root/.nix-profile/bin"  # Based on your logs
+
+    log(f"Using FFmpeg directory: {ffmpeg_dir}")
+    return ffmpeg_path, ffmpeg_dir
+
+
+# Resolve FFmpeg at import so no download pays for the discovery
+_resolve_ffmpeg()
+
+
+@lru_cache(maxsize=None)
+def _get_mp3_encoder(ffmpeg_path):
+    """Return the fastest MP3 encoder this ffmpeg provides"""
+    try:
+        result = subprocess.run([ffmpeg_path, "-hide_banner", "-encoders"], capture_output=True, text=True, timeout=5)
+    except Exception as e:
+        log(f"Error listing FFmpeg encoders: {str(e)}")
+        return 'libmp3lame'
+    # libshine is a fixed-point MP3 encoder, several times faster than the default libmp3lame
+    if " libshine " in result.stdout:
+        log("Using libshine for MP3 encoding")
+        return 'libshine'
+    return 'libmp3lame'
+
 
+def _safe_title(song):
+    return _UNSAFE_FILENAME_CHARS.sub('', f"{song['artist']} - {song['title']}")
 
-def download_song(song, url):
+def _throttle_search():
+    """Block until this thread may send the next ytsearch query"""
+    global _next_search_at
+    with _search_lock:
+        now = time.monotonic()
+        wait = _next_search_at - now
+        _next_search_at = max(now, _next_search_at) + 1 / SEARCH_RATE_LIMIT
+    if wait > 0:
+        time.sleep(wait)
+
+def _extract_with_backoff(ydl, query, **kwargs):
+    """Run extract_info, backing off exponentially while YouTube rate-limits us"""
+    for attempt in range(SEARCH_RETRIES):
+        if query.startswith('ytsearch'):
+            _throttle_search()
+        try:
+            return ydl.extract_info(query, download=True, **kwargs)
+        except yt_dlp.utils.DownloadError as e:
+            if attempt == SEARCH_RETRIES - 1 or not _RATE_LIMITED.search(str(e)):
+                raise
+            delay = 2 ** attempt + random.random()
+            log(f"Rate limited by YouTube, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def download_song(song, output_dir):
+    """Search YouTube for a song and download its source audio into output_dir
+
+    Returns the path of the downloaded file, which convert_song turns into the final track.
+    """
     try:
         log(f"Starting download for: {song['title']}")
         
-        # Try to find FFmpeg and FFprobe in common locations
-        ffmpeg_locations = [
-            "ffmpeg",  # Look in PATH
-            "/usr/bin/ffmpeg",
-            "/usr/local/bin/ffmpeg",
-            "/nix/store/*/ffmpeg/bin/ffmpeg"  # Nixpacks often installs here
-        ]
+        safe_title = _safe_title(song)
+        # The .source suffix keeps the download apart from the converted file of the same format
+        output_path = os.path.join(output_dir, f'{safe_title}.source.%(ext)s')
         
-        ffprobe_locations = [
-            "ffprobe",  # Look in PATH
-            "/usr/bin/ffprobe",
-            "/usr/local/bin/ffprobe",
-            "/nix/store/*/ffmpeg/bin/ffprobe"  # Nixpacks often installs here
-        ]
+        ydl = _get_youtube_dl()
+        ydl.params['outtmpl']['default'] = output_path
         
-        # Log available paths
-        try:
-            import glob
-            for pattern in ["/nix/store/*/ffmpeg/bin/ffmpeg", "/nix/store/*/bin/ffmpeg"]:
-                matches = glob.glob(pattern)
-                for match in matches:
-                    log(f"Found potential FFmpeg at: {match}")
-            
-            # Check if ffmpeg is in PATH
-            result = subprocess.run(["which", "ffmpeg"], capture_output=True, text=True)
-            if result.returncode == 0:
-                log(f"FFmpeg found in PATH at: {result.stdout.strip()}")
-            else:
-                log("FFmpeg not found in PATH")
-                
-            # List contents of /nix/store to help diagnose
-            if os.path.exists("/nix/store"):
-                nix_dirs = os.listdir("/nix/store")
-                ffmpeg_dirs = [d for d in nix_dirs if "ffmpeg" in d]
-                if ffmpeg_dirs:
-                    log(f"Found potential FFmpeg directories in /nix/store: {ffmpeg_dirs}")
-        except Exception as e:
-            log(f"Error during path discovery: {str(e)}")
+        # Let yt-dlp resolve the search itself so no YouTube Data API quota is spent,
+        # skipping it entirely when this song was matched before
+        search_key = f"youtube:{song['artist']}|{song['title']}".lower()
+        video_id = cache.get(search_key)
+        log("Starting download with yt-dlp")
+        info = None
+        if video_id:
+            try:
+                # A bare ID with ie_key goes straight to the YouTube extractor, skipping URL dispatch
+                info = _extract_with_backoff(ydl, video_id, ie_key='Youtube')
+            except yt_dlp.utils.DownloadError as e:
+                if _RATE_LIMITED.search(str(e)):
+                    raise
+                # The match was deleted, made private or blocked since; search for a new one
+                log(f"Cached video {video_id} failed for {song['title']}, searching again")
+                cache.delete(search_key)
+                video_id = None
+        if not video_id:
+            info = _extract_with_backoff(ydl, f"ytsearch1:{song['artist']} - {song['title']}")
         
-        # Use the first working FFmpeg we find
-        ffmpeg_path = None
-        for loc in ffmpeg_locations:
-            if '*' in loc:
-                # Handle glob patterns
-                import glob
-                matches = glob.glob(loc)
-                for match in matches:
-                    try:
-                        result = subprocess.run([match, "-version"], capture_output=True, check=True, timeout=5)
-                        log(f"Found working FFmpeg at: {match}")
-                        ffmpeg_path = match
-                        break
-                    except Exception:
-                        continue
-            else:
-                try:
-                    result = subprocess.run([loc, "-version"], capture_output=True, check=True, timeout=5)
-                    log(f"Found working FFmpeg at: {loc}")
-                    ffmpeg_path = loc
-                    break
-                except Exception:
-                    continue
+        # Search results come back as a one-entry playlist
+        if info and 'entries' in info:
+            info = info['entries'][0] if info['entries'] else None
+            if info and not video_id:
+                cache.set(search_key, info['id'], expire=SEARCH_CACHE_TTL)
         
-        if not ffmpeg_path:
-            log("ERROR: Could not find a working FFmpeg installation!")
+        requested = (info or {}).get('requested_downloads') or [{}]
+        source_path = requested[0].get('filepath')
+        
+        if source_path and os.path.exists(source_path):
+            log(f"Successfully downloaded: {os.path.basename(source_path)}")
+            return source_path
+        else:
+            log(f"File not found after download for: {song['title']}")
             return None
             
-        log(f"Using FFmpeg from: {ffmpeg_path}")
-        
-        # Find the full path when ffmpeg_path is just the command name
-        if ffmpeg_path == "ffmpeg":
-            # Get the full path
-            try:
-                full_path_result = subprocess.run(["which", "ffmpeg"], capture_output=True, text=True, check=True)
-                ffmpeg_path = full_path_result.stdout.strip()
-                log(f"Resolved FFmpeg full path: {ffmpeg_path}")
-            except Exception as e:
-                log(f"Error resolving full path: {str(e)}")
-                # Fallback to known path from logs
-                ffmpeg_path = "/root/.nix-profile/bin/ffmpeg"
-                log(f"Using fallback FFmpeg path: {ffmpeg_path}")
 
-        # Now extract the directory
-        ffmpeg_dir = os.path.dirname(ffmpeg_path)
+    except Exception as e:
+        log(f"Error in download_song: {str(e)}")
+        logger.debug("Traceback:", exc_info=True)
+        return None
 
-        # Check if directory is not empty
-        if not ffmpeg_dir:
-            log("WARNING: FFmpeg directory is empty, using hardcoded path")
-            ffmpeg_dir = "/root/.nix-profile/bin"  # Based on your logs
 
-        log(f"Using FFmpeg directory: {ffmpeg_dir}")
-        
-        safe_title = "".join(x for x in f"{song['artist']} - {song['title']}" if x.isalnum() or x in "- ")
-        output_path = os.path.join(TEMP_DIR, f'{safe_title}.%(ext)s')
+def convert_song(song, source_path):
+    """Convert a downloaded source file to AUDIO_CODEC with song metadata, returning the filename"""
+    try:
+        ffmpeg_path, _ = _resolve_ffmpeg()
+        if not ffmpeg_path:
+            log("ERROR: Could not find a working FFmpeg installation!")
+            return None
         
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'ffmpeg_location': ffmpeg_dir,  # Pass the directory containing ffmpeg
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
-            'outtmpl': output_path,
-            'quiet': False,
-            'no_warnings': False,
-            'logger': CustomLogger(),
-            'writethumbnail': False,
-            'postprocessor_args': [
-                '-metadata', f'title={song["title"]}',
-                '-metadata', f'artist={song["artist"]}'
-            ],
-        }
+        source_dir = os.path.dirname(source_path)
+        safe_title = os.path.basename(source_path).split('.source.')[0]
+        final_filename = f"{safe_title}.{AUDIO_CODEC}"
+        final_path = os.path.join(source_dir, final_filename)
         
-        log(f"Starting download with yt-dlp, FFmpeg directory: {ffmpeg_dir}")
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
+        if AUDIO_CODEC == 'mp3':
+            codec_args = ['-c:a', _get_mp3_encoder(ffmpeg_path), '-b:a', '192k']
+        elif source_path.endswith('.m4a'):
+            # YouTube's m4a streams are AAC already, so only the container is rewritten
+            codec_args = ['-c:a', 'copy']
+        else:
+            codec_args = ['-c:a', 'aac', '-b:a', '192k']
         
-        final_filename = f"{safe_title}.mp3"
-        final_path = os.path.join(TEMP_DIR, final_filename)
+        subprocess.run([
+            ffmpeg_path, '-y', '-loglevel', 'error',
+            '-i', source_path,
+            '-vn', *codec_args,
+            '-metadata', f'title={song["title"]}',
+            '-metadata', f'artist={song["artist"]}',
+            '-threads', '0',
+            final_path
+        ], capture_output=True, text=True, check=True)
+        os.remove(source_path)
         
-        if os.path.exists(final_path):
-            log(f"Successfully downloaded: {final_filename}")
-            return final_filename
-        else:
-            log(f"File not found after download: {final_path}")
-            return None
-            
+        log(f"Successfully converted: {final_filename}")
+        return final_filename
+    
+    except subprocess.CalledProcessError as e:
+        log(f"FFmpeg failed for {song['title']}: {e.stderr.strip()}")
+        return None
+    except Exception as e:
+        log(f"Error in convert_song: {str(e)}")
+        logger.debug("Traceback:", exc_info=True)
+        return None
 
+def _audio_cache_key(song):
+    return f"{AUDIO_CODEC}:{song['artist']}|{song['title']}".lower()
+
+def restore_cached_song(song, output_dir):
+    """Copy a previously converted song into output_dir, returning its filename or None"""
+    try:
+        cached = audio_cache.get(_audio_cache_key(song), read=True)
+        if cached is None:
+            return None
+        final_filename = f"{_safe_title(song)}.{AUDIO_CODEC}"
+        with cached, open(os.path.join(output_dir, final_filename), 'wb') as dst:
+            shutil.copyfileobj(cached, dst, 1024 * 1024)
+        log(f"Using cached audio for: {song['title']}")
+        return final_filename
     except Exception as e:
-        log(f"Error in download_song: {str(e)}")
-        log(traceback.format_exc())
+        log(f"Error restoring cached audio for {song['title']}: {str(e)}")
         return None
 
-def download_playlist(songs, links):
-    """Download all songs and create ZIP file"""
+def store_cached_song(song, path):
+    """Keep a converted song so later playlists can reuse it"""
+    try:
+        with open(path, 'rb') as f:
+            audio_cache.set(_audio_cache_key(song), f, read=True)
+    except Exception as e:
+        log(f"Error caching audio for {song['title']}: {str(e)}")
+
+async def download_playlist(songs, progress=None):
+    """Download all songs into a playlist directory that is zipped on request
+
+    progress, if given, is called as progress(completed, total) after each song finishes.
+    It runs on the cache pool, so it may block.
+    """
     log("Starting download_playlist function...")
     downloaded_files = []
     successful_downloads = []
+    errors = []
     
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        future_to_song = {
-            executor.submit(download_song, song, link): song
-            for song, link in zip(songs, links) if link != "No result found" and not link.startswith("Error:")
-        }
-        
-        for future in as_completed(future_to_song):
-            song = future_to_song[future]
-            
-            file = future.result()
-            if file:
-                downloaded_files.append(file)
-                successful_downloads.append({
-                    "title": song['title'],
-                    "artist": song['artist'],
-                    "duration": song['duration']
-                })
+    # Nanosecond stamps stay sortable and keep two jobs started in the same second apart
+    timestamp = time.time_ns()
+    playlist_name = f'playlist_downloads_{timestamp}'
+    playlist_dir = os.path.join(TEMP_DIR, playlist_name)
+    os.makedirs(playlist_dir, exist_ok=True)
+    
+    # The shared download and transcode pools keep network-bound downloads and CPU-bound
+    # conversions from starving each other, and cap both across every running job
+    log(f"Downloading {len(songs)} songs with {DOWNLOAD_CONCURRENCY} download workers")
+    loop = asyncio.get_running_loop()
+    completed = 0
+    
+    async def download(song):
+        nonlocal completed
+        try:
+            # Cache hits don't take a download slot
+            final_filename = await loop.run_in_executor(_cache_executor, restore_cached_song, song, playlist_dir)
+            if final_filename:
+                return final_filename
+            source_path = await loop.run_in_executor(_download_executor, download_song, song, playlist_dir)
+            if not source_path:
+                return None
+            final_filename = await loop.run_in_executor(_transcode_executor, convert_song, song, source_path)
+            if final_filename:
+                final_path = os.path.join(playlist_dir, final_filename)
+                await loop.run_in_executor(_cache_executor, store_cached_song, song, final_path)
+            return final_filename
+        finally:
+            completed += 1
+            if progress:
+                # Progress callbacks may block, e.g. on the job store's SQLite lock
+                await loop.run_in_executor(_cache_executor, progress, completed, len(songs))
+    
+    results = await asyncio.gather(*(download(song) for song in songs), return_exceptions=True)
+    
+    for song, file in zip(songs, results):
+        if file and not isinstance(file, BaseException):
+            downloaded_files.append(file)
+            successful_downloads.append({
+                "title": song['title'],
+                "artist": song['artist'],
+                "duration": song['duration']
+            })
+        else:
+            errors.append(f"{song['artist']} - {song['title']}")
     
     if not downloaded_files:
         log("No files were downloaded successfully")
-        return None, successful_downloads
+        _cleanup_executor.submit(shutil.rmtree, playlist_dir, ignore_errors=True)
+        return None, successful_downloads, errors
     
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    zip_filename = f'playlist_downloads_{timestamp}.zip'
-    zip_path = os.path.join(DOWNLOADS_DIR, zip_filename)
+    # Drop partial files left by failed downloads so the archive only holds finished songs
+    finished = set(downloaded_files)
+    with os.scandir(playlist_dir) as entries:
+        for entry in entries:
+            if entry.name not in finished:
+                try:
+                    os.remove(entry.path)
+                except Exception as e:
+                    log(f"Error cleaning up {entry.name}: {str(e)}")
     
-    try:
-        with zipfile.ZipFile(zip_path, 'w') as zipf:
-            for file in downloaded_files:
-                file_path = os.path.join(TEMP_DIR, file)
-                if os.path.exists(file_path):
-                    zipf.write(file_path, file)
-                    os.remove(file_path)
-                else:
-                    log(f"File not found: {file_path}")
-    except Exception as e:
-        log(f"Error creating zip file: {str(e)}")
-        return None, successful_downloads
+    return f'{playlist_name}.zip', successful_downloads, errors
+
+
+def get_playlist_dir(zip_filename):
+    """Return the directory holding the songs for a playlist ZIP, or None if unknown"""
+    playlist_name, ext = os.path.splitext(zip_filename)
+    if ext != '.zip' or not playlist_name.startswith('playlist_downloads_') or os.path.basename(playlist_name) != playlist_name:
+        return None
+    playlist_dir = os.path.join(TEMP_DIR, playlist_name)
+    return playlist_dir if os.path.isdir(playlist_dir) else None
+
+
+def stream_playlist_zip(zip_filename):
+    """Build a ZIP stream over a downloaded playlist without writing the archive to disk"""
+    playlist_dir = get_playlist_dir(zip_filename)
+    if not playlist_dir:
+        return None
     
-    return zip_filename, successful_downloads
+    # Sized streams let the response carry a Content-Length header
+    zs = ZipStream(compress_type=ZIP_COMPRESSION, sized=True)
+    # One directory read gives names, paths and file types without a stat per song
+    with os.scandir(playlist_dir) as entries:
+        files = sorted((entry for entry in entries if entry.is_file()), key=lambda entry: entry.name)
+    for entry in files:
+        zs.add_path(entry.path, arcname=entry.name, compress_type=ZIP_COMPRESSION)
+    return zs
+
+
+def remove_playlist_files(zip_filename):
+    """Delete the downloaded songs once their ZIP has been streamed"""
+    playlist_dir = get_playlist_dir(zip_filename)
+    if playlist_dir:
+        # Renaming is a single syscall; the per-file unlinks happen in the background
+        deleted_dir = os.path.join(TEMP_DIR, f'.deleted_{uuid4().hex}')
+        try:
+            os.replace(playlist_dir, deleted_dir)
+        except OSError as e:
+            log(f"Error moving {playlist_dir} aside: {str(e)}")
+            deleted_dir = playlist_dir
+        _cleanup_executor.submit(shutil.rmtree, deleted_dir, ignore_errors=True)
 
 
 def extract_playlist_id(playlist_url):
     """Extract Spotify playlist ID from URL"""
-    try:
-        parsed_url = urlparse(playlist_url)
-        path_parts = parsed_url.path.split('/')
-        if 'playlist' in path_parts:
-            return path_parts[path_parts.index('playlist') + 1]
-    except Exception:
-        return None
-    return None
+    match = _PLAYLIST_ID.search(playlist_url)
+    return match.group(1) if match else None
 
 
 def process_playlist(playlist_url):
@@ -330,33 +627,28 @@ def process_playlist(playlist_url):
         
     except Exception as e:
         log(f"Error processing playlist: {str(e)}")
-        log(traceback.format_exc())
+        logger.debug("Traceback:", exc_info=True)
         return {"success": False, "error": str(e)}
 
 
-def start_download(songs):
+async def start_download(songs, progress=None):
     """Start the actual download process after confirmation"""
     try:
-        youtube_links = get_youtube_links(songs)
-        errors = [link for link in youtube_links if link.startswith("Error:") or link == "No result found"]
-        
-        zip_filename, successful_downloads = download_playlist(songs, youtube_links)
+        zip_filename, successful_downloads, errors = await download_playlist(songs, progress)
         
         if zip_filename:
-            zip_path = os.path.join(DOWNLOADS_DIR, zip_filename)
-            if os.path.exists(zip_path) and os.path.getsize(zip_path) > 0:
-                return {
-                    "success": True,
-                    "phase": "complete",
-                    "songCount": len(successful_downloads),
-                    "zipFile": zip_filename,
-                    "errors": errors,
-                    "downloadedSongs": successful_downloads
-                }
+            return {
+                "success": True,
+                "phase": "complete",
+                "songCount": len(successful_downloads),
+                "zipFile": zip_filename,
+                "errors": errors,
+                "downloadedSongs": successful_downloads
+            }
         
         return {
             "success": False,
-            "error": "Failed to create zip file or no songs were downloaded",
+            "error": "No songs were downloaded",
             "songCount": len(songs),
             "errors": errors,
             "downloadedSongs": successful_downloads
@@ -364,19 +656,50 @@ def start_download(songs):
         
     except Exception as e:
         log(f"Error during download: {str(e)}")
-        log(traceback.format_exc())
+        logger.debug("Traceback:", exc_info=True)
         return {"success": False, "error": str(e)}
 
 
+def set_job_status(job_id, status):
+    """Record a download job's status where every server worker can read it"""
+    cache.set(f"job:{job_id}", status, expire=JOB_TTL)
+
+
+def get_job_status(job_id):
+    """Return a download job's status, or None if the job is unknown"""
+    return cache.get(f"job:{job_id}")
+
+
+async def run_download_job(job_id, songs):
+    """Run start_download in the background, recording progress under job_id"""
+    def report(completed, total):
+        set_job_status(job_id, {"state": "running", "completed": completed, "total": total})
+    
+    # Job status writes go through SQLite, so keep them off the event loop
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_cache_executor, report, 0, len(songs))
+    result = {"success": False, "error": "Download did not finish"}
+    try:
+        result = await start_download(songs, progress=report)
+    finally:
+        await loop.run_in_executor(_cache_executor, set_job_status, job_id, {
+            "state": "finished",
+            "completed": len(songs),
+            "total": len(songs),
+            "result": result
+        })
+
+
 def cleanup_temp_files():
     """Clean up temporary files"""
-    for file in os.listdir(TEMP_DIR):
-        try:
-            file_path = os.path.join(TEMP_DIR, file)
-            if os.path.isfile(file_path):
-                os.remove(file_path)
-        except Exception as e:
-            log(f"Error cleaning up {file}: {str(e)}")
+    # scandir's DirEntry answers is_file() from the directory read, saving a stat per entry
+    with os.scandir(TEMP_DIR) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file(follow_symlinks=False):
+                    os.remove(entry.path)
+            except Exception as e:
+                log(f"Error cleaning up {entry.name}: {str(e)}")
 
 
 if __name__ == "__main__":